@@ -1,91 +1,340 @@
-import mdtraj as md
+import os
+import threading
 import numpy as np
-import file_io
 
+try:
+    import numba
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
-def calc_vectors(p_origin, p_destination, boxdims):
+try:
+    import cupy as cp
+    HAS_CUPY = True
+except ImportError:
+    HAS_CUPY = False
+
+# numpy code paths work through the trajectory in blocks of frames roughly this size, so that intermediates of a
+# multi step calculation stay in cache instead of being streamed through main memory once per step
+_TILE_BYTES = 128 * 1024
+
+# work buffers of the tiled numpy code paths, kept between calls. Keyed by thread, shape and dtype
+_SCRATCH = {}
+_MAX_SCRATCH_BUFFERS = 16
+
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _pbc_vectors(origin, dest, box, inv_box, out):
+        '''
+            Fused minimum image vector calculation, see calc_vectors. Writes into out. inv_box is 1 / box in the same
+            dtype, so the inner loop is multiply and round only - no divides, and no promotion of float32 to float64,
+            which lets LLVM use packed SIMD rounding instructions instead of scalar libm calls
+        '''
+        nframes, nparticles, ndims = origin.shape
+        for f in prange(nframes):
+            for p in range(nparticles):
+                for d in range(ndims):
+                    r = dest[f, p, d] - origin[f, p, d]
+                    out[f, p, d] = r - box[f, d] * np.rint(r * inv_box[f, d])
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _scaled_posres_forces(traj, ref, scale_factor, k, out):
+        ''' Fused reference scaling, displacement and spring force calculation, see calc_scaled_posres_forces '''
+        nframes, nparticles, _ = traj.shape
+        ref_stride = 0 if ref.shape[0] == 1 else 1  # single reference frame is reused for every frame
+        for f in prange(nframes):
+            rf = f * ref_stride
+            sx = scale_factor[f, 0, 0]
+            sy = scale_factor[f, 0, 1]
+            sz = scale_factor[f, 0, 2]
+            for p in range(nparticles):
+                out[f, p, 0] = k * (traj[f, p, 0] - ref[rf, p, 0] * sx)
+                out[f, p, 1] = k * (traj[f, p, 1] - ref[rf, p, 1] * sy)
+                out[f, p, 2] = k * (traj[f, p, 2] - ref[rf, p, 2] * sz)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _pbc_scaled_posres_forces(traj, ref, scale_factor, box, inv_box, k, out):
+        ''' Fused reference scaling, minimum image displacement and spring force, see calc_pbc_scaled_posres_forces '''
+        nframes, nparticles, ndims = traj.shape
+        ref_stride = 0 if ref.shape[0] == 1 else 1  # single reference frame is reused for every frame
+        for f in prange(nframes):
+            rf = f * ref_stride
+            for p in range(nparticles):
+                for d in range(ndims):
+                    r = traj[f, p, d] - ref[rf, p, d] * scale_factor[f, 0, d]
+                    out[f, p, d] = k * (r - box[f, d] * np.rint(r * inv_box[f, d]))
+
+
+def _frame_tile(xyz, dtype):
+    ''' Number of frames of an n_frames * n_particles * n_dims array that fit into _TILE_BYTES, at least 1 '''
+    frame_bytes = xyz.shape[1] * xyz.shape[2] * np.dtype(dtype).itemsize
+    return max(1, _TILE_BYTES // max(1, frame_bytes))
+
+
+if HAS_CUPY:
+    @cp.fuse()
+    def _cupy_pbc_vectors(origin, dest, box):
+        ''' Fused minimum image vector calculation on the GPU, see calc_vectors '''
+        r = dest - origin
+        return r - box * cp.rint(r / box)
+
+    @cp.fuse()
+    def _cupy_scaled_posres_forces(traj, ref, scale_factor, k):
+        ''' Fused reference scaling and spring force calculation on the GPU, see calc_scaled_posres_forces '''
+        return k * (traj - ref * scale_factor)
+
+
+def _use_cupy(backend, out):
+    ''' Checks the requested backend can be used, returns True if the calculation should run on the GPU with cupy '''
+    if backend == 'numpy':
+        return False
+    if backend != 'cupy':
+        raise ValueError("unknown backend '{}', should be 'numpy' or 'cupy'".format(backend))
+    if not HAS_CUPY:
+        raise ImportError("cupy backend requested, but cupy could not be imported")
+    if out is not None:
+        raise ValueError("out is only supported by the numpy backend")
+    return True
+
+
+def set_num_threads(n_threads=None):
+    '''
+        Sets the number of threads the numba kernels split trajectory frames over, e.g. to leave cores free for other
+        work. Frames are independent, so the kernels scale with the number of cores. Does nothing if numba is not
+        installed.
+
+        Parameters
+            n_threads - number of threads. Defaults to the number of cores this process is allowed to run on, capped
+                        at the size of numba's thread pool
+    '''
+    if not HAS_NUMBA:
+        return
+    if n_threads is None:
+        n_threads = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    numba.set_num_threads(max(1, min(n_threads, numba.config.NUMBA_NUM_THREADS)))
+
+
+def _scratch(shape, dtype):
+    ''' Returns a reusable work buffer. Contents are undefined and overwritten by the next call for the same shape '''
+    key = (threading.get_ident(), shape, np.dtype(dtype))
+    if key not in _SCRATCH:
+        if len(_SCRATCH) >= _MAX_SCRATCH_BUFFERS:
+            _SCRATCH.clear()
+        _SCRATCH[key] = np.empty(shape, dtype=dtype)
+    return _SCRATCH[key]
+
+
+def _output_array(out, shape, dtype):
+    ''' Returns out if it can hold a result of the given shape, or a new array when no output array is given '''
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError("output array shape {} does not match result shape {}".format(out.shape, shape))
+    return out
+
+
+def _float_dtype(*xyz):
+    '''
+        Floating point dtype of calculations on the given coordinate arrays. mdtraj coordinates are float32, and box
+        dimensions and spring constants are cast to match so that nothing silently promotes the result to float64
+    '''
+    return np.result_type(*(x.dtype for x in xyz), 1.0)
+
+
+# input validation. The numba kernels do no bounds checking, and the tiled numpy code paths slice every input by frame
+# so mismatched frame counts don't raise a broadcast error. Code paths that use either always run these O(1) shape
+# checks. The rest are single numpy broadcasts that raise on bad shapes by themselves, and only check under __debug__
+def _check_vector_inputs(p_origin, p_destination, boxdims):
+    ''' Shape checks for calc_vectors '''
+    if p_origin.ndim != 3:
+        raise ValueError(f"coordinates should be nframes * nparticles * ndims, p_origin shape = {p_origin.shape}")
+    if boxdims.ndim != 2:
+        raise ValueError(f"boxdims should be nframes * nparticles, boxdims shape = {boxdims.shape}")
+    if p_origin.shape != p_destination.shape:
+        raise ValueError(f"input vector dimension mismatch. Origin shape = {p_origin.shape}, "
+                         f"destination shape =  {p_destination.shape}")
+    if p_origin.shape[0] != boxdims.shape[0]:  # mismatch between number of frames in coords and boxdims
+        raise ValueError(f"Mismatch between number of frames in coordinates ({p_origin.shape[0]}) "
+                         f"and boxdims ({boxdims.shape[0]})")
+    if p_origin.shape[2] != boxdims.shape[1]:  # mismatch between dimensionality
+        raise ValueError(f"Mismatch between number of dimensions in coordinates ({p_origin.shape[2]}) "
+                         f"and boxdims ({boxdims.shape[1]})")
+
+
+def _check_scaling_inputs(traj_xyz, traj_dims, ref_dims, single_frame_ok=False):
+    ''' Shape checks for box scaling, single_frame_ok allows a 1 frame traj_xyz to be broadcast against traj_dims '''
+    if traj_xyz.shape[2] != 3 or traj_dims.shape[1] != 3 or ref_dims.shape != (3,):
+        raise ValueError("One of the inputs does not have 3 as it's final dimension size")
+    if traj_xyz.shape[0] != traj_dims.shape[0] and not (single_frame_ok and traj_xyz.shape[0] == 1):
+        raise ValueError(f"trajectory coords/dims have different frame counts: {traj_xyz.shape[0]} "
+                         f"vs {traj_dims.shape[0]}")
+
+
+def _check_scale_factor(traj_dims, scale_factor):
+    ''' Checks a precomputed scale factor matches the trajectory box dimensions '''
+    if scale_factor.shape != (traj_dims.shape[0], 1, 3):
+        raise ValueError(f"scale_factor should be nframes * 1 * 3, scale_factor shape = {scale_factor.shape}")
+
+
+def _check_inverse_boxdims(boxdims, inv_boxdims):
+    ''' Checks precomputed inverse box dimensions match the box dimensions '''
+    if inv_boxdims.shape != boxdims.shape:
+        raise ValueError(f"inv_boxdims shape {inv_boxdims.shape} does not match boxdims shape {boxdims.shape}")
+
+
+def _check_reference(traj_xyz, ref_xyz):
+    ''' Checks reference coordinates have one frame or as many frames as traj_xyz, and the same particles '''
+    if ref_xyz.shape[0] not in (1, traj_xyz.shape[0]) or ref_xyz.shape[1:] != traj_xyz.shape[1:]:
+        raise ValueError(f"reference shape {ref_xyz.shape} can not be matched to trajectory shape {traj_xyz.shape}")
+
+
+def aos_to_soa(xyz):
+    '''
+        Splits an n_frames * n_particles * n_dims coordinate array (mdtraj layout, dimensions interleaved) into one
+        contiguous n_frames * n_particles array per dimension.
+
+        Parameters
+            xyz        - n_frames * n_particles * n_dims coordinate array
+
+        Returns
+            components - tuple of n_dims arrays of shape n_frames * n_particles
+    '''
+    return tuple(np.ascontiguousarray(xyz[..., d]) for d in range(xyz.shape[-1]))
+
+
+def soa_to_aos(*components, out=None):
+    ''' Inverse of aos_to_soa, interleaves per dimension arrays back into an n_frames * n_particles * n_dims array '''
+    return np.stack(components, axis=-1, out=out)
+
+
+def calc_vectors(p_origin, p_destination, boxdims, out=None, backend='numpy', inv_boxdims=None):
     """
         MDtraj has functionality for computing distances but it's not always applicable to every dataset, and distances
         contain no directonality. This function will calculate vectors for coordinates, taking into account the box
         dimensions. For simplicity, will only take in mdtraj xyz shaped arrays (and trajectory.unitcell_lengths)
 
-        Note that this will only calculate vectors within 1 periodic image!
+        Uses the minimum image convention, so vectors are always mapped to the closest periodic image.
 
         Parameters
             p_origin      - n_frames * n_particles * n_dimensions coordinate array
             p_destination - n_frames * n_particles * n_dimensions coordinate array - same size as p_origin
             boxdims       - n_frames * n_dimensions array of box dimensions
+            out           - (optional) n_frames * n_particles * n_dimensions array to write the vectors into
+            backend       - 'numpy', or 'cupy' to calculate on the GPU. The cupy backend returns a cupy array
+            inv_boxdims   - (optional) precomputed 1 / boxdims, for repeated calls on the same box dimensions. Not
+                            used by the cupy backend
 
         Returns
             vecs -n_frames * n_particles * n_dimensions array
     """
-    if not p_origin.ndim == 3:
-        raise ValueError("coordinates should be nframes * nparticles * ndims, p_origin shape = {}".format(p_origin.shape))   # noqa
-    if not boxdims.ndim == 2:
-        raise ValueError("boxdims should be nframes * nparticles, boxdims shape = {}".format(boxdims.shape))
-    if not p_origin.shape == p_destination.shape:
-        raise ValueError("input vector dimension mismatch. Origin shape = {}, destination shape =  {}".format(
-                         p_origin.shape, p_destination.shape))
-    if not p_origin.shape[0] == boxdims.shape[0]:  # mismatch between number of frames in coords and boxdims
-        raise ValueError("Mismatch between number of frames in coordinates ({}) and boxdims ({})".format(
-                         p_origin.shape[0], boxdims.shape[0]))
-    if not p_origin.shape[2] == boxdims.shape[1]:  # mismatch between dimensionality
-        raise ValueError("Mismatch between number of dimensions in coordinates ({}) and boxdims ({})".format(
-                         p_origin.shape[2], boxdims.shape[1]))
-
-    boxdims_reshaped = boxdims[:, np.newaxis, :]  # allows broadcasting
-    boxdims_midpoint = boxdims_reshaped / 2
-    vecs = p_destination - p_origin
-    veclengths = np.abs(vecs)
-
-    # these are the vectors who's periodic image are closer than the original vecotor
-    vecs_gt_boxdims = veclengths >  (boxdims_midpoint)  # these positions will be changed
-
-    # boolean arrays for identifying closest periodic image - based on vector direction instead of
-    # place in box, which might not be centered on (0, 0, 0)
-    negative_vecs = vecs < 0
-    positive_vecs = vecs > 0
-
-    # for positive vectors greater than half the box, use previous periodic image
-    vecs[vecs_gt_boxdims & positive_vecs] = -(boxdims_reshaped - veclengths)[vecs_gt_boxdims & positive_vecs]
-
-    # for negative vectors greater than half the box, use next periodic image.
-    vecs[vecs_gt_boxdims & negative_vecs] = (boxdims_reshaped - veclengths)[vecs_gt_boxdims & negative_vecs]
+    _check_vector_inputs(p_origin, p_destination, boxdims)
+    if inv_boxdims is not None:
+        _check_inverse_boxdims(boxdims, inv_boxdims)
+
+    dtype = _float_dtype(p_origin, p_destination)
+    if _use_cupy(backend, out):
+        return _cupy_pbc_vectors(cp.asarray(p_origin, dtype=dtype), cp.asarray(p_destination, dtype=dtype),
+                                 cp.asarray(boxdims, dtype=dtype)[:, np.newaxis, :])
+
+    vecs = _output_array(out, p_origin.shape, dtype)
+    boxdims = boxdims.astype(vecs.dtype, copy=False)
+    inv_boxdims = np.reciprocal(boxdims) if inv_boxdims is None else inv_boxdims.astype(vecs.dtype, copy=False)
+    if HAS_NUMBA:
+        _pbc_vectors(p_origin, p_destination, boxdims, inv_boxdims, vecs)
+        return vecs
+
+    n_frames, n_particles = p_origin.shape[:2]
+    tile = _frame_tile(p_origin, vecs.dtype)
+    scratch = _scratch((min(tile, n_frames), n_particles), vecs.dtype)
+    for f0 in range(0, n_frames, tile):
+        f1 = min(f0 + tile, n_frames)
+        tile_vecs, tile_shift = vecs[f0:f1], scratch[:f1 - f0]
+        np.subtract(p_destination[f0:f1], p_origin[f0:f1], out=tile_vecs)
+
+        # minimum image convention - shift each component by the nearest whole number of box lengths. Based on
+        # vector direction instead of place in box, which might not be centered on (0, 0, 0). Done on one contiguous
+        # plane per dimension, where the box length is a single value per frame broadcast along the particles
+        planes = aos_to_soa(tile_vecs)
+        for d, plane in enumerate(planes):
+            np.multiply(plane, inv_boxdims[f0:f1, d, np.newaxis], out=tile_shift)
+            np.rint(tile_shift, out=tile_shift)
+            np.multiply(tile_shift, boxdims[f0:f1, d, np.newaxis], out=tile_shift)
+            np.subtract(plane, tile_shift, out=plane)
+        soa_to_aos(*planes, out=tile_vecs)
 
     return vecs
 
 
 def multiply_coordinate_frame(ref_xyz, n_frames):
-    ''' Takes references coordinates and repeats them so that they have same dimensions as a trajectory xyz array'''
-    return np.repeat(ref_xyz, n_frames, axis=0)
+    '''
+        Takes a single frame of reference coordinates and repeats it so that it has the same dimensions as a
+        trajectory xyz array. The result is a read only view of ref_xyz, no coordinates are copied
+
+        Parameters
+            -ref_xyz   - 1 * n_particles * n_dims array of coordinates
+            -n_frames  - number of frames to repeat the reference for
+
+        Returns
+            -frame_xyz - read only n_frames * n_particles * n_dims view of ref_xyz
+    '''
+    if ref_xyz.shape[0] != 1:
+        raise ValueError("reference coordinates should have a single frame, ref_xyz shape = {}".format(ref_xyz.shape))
+    return np.broadcast_to(ref_xyz, (n_frames,) + ref_xyz.shape[1:])
 
 
-def scale_box_coordinates(traj_xyz, traj_dims, ref_dims):
+def calc_scale_factor(traj_dims, ref_dims, dtype=None):
+    '''
+        Fractional size of each trajectory box compared to the reference box, as used for scaling coordinates. When
+        the same trajectory is scored against several references or spring constants, calculate this once and pass it
+        as scale_factor to scale_box_coordinates / calc_scaled_posres_forces
+
+        Parameters
+            -traj_dims    - n_frames * 3 array of box dimensions
+            -ref_dims     - size 3 array of box dimensions
+            -dtype        - (optional) floating point dtype of the result, defaults to that of traj_dims
+
+        Returns
+            -scale_factor - contiguous n_frames * 1 * 3 array, broadcasts against n_frames * n_particles * 3 coordinates
+    '''
+    if dtype is None:
+        dtype = _float_dtype(traj_dims)
+    scale_factor = np.divide(traj_dims.astype(dtype, copy=False), ref_dims.astype(dtype, copy=False))
+    return scale_factor[:, np.newaxis, :]
+
+
+def scale_box_coordinates(traj_xyz, traj_dims, ref_dims, out=None, scale_factor=None):
     '''
         Scales a coordinate set in 3 dimensions according to changing box size. The scaling is by the fractional size
         of the trajectory box compared to a static reference box dimension. The trajectory, box dimensions, and
         reference dimensions all need to be 3D.
 
         Parameters
-            -traj_xyz    - n_frames * n_particles * 3 array of coordinates
-            -traj_dims   - n_frames * 3               array of box dimensions
-            -ref_dims    - size 3 array of box dimensions
+            -traj_xyz     - n_frames * n_particles * 3 array of coordinates. A single 1 * n_particles * 3 frame
+                            is broadcast against every frame of traj_dims
+            -traj_dims    - n_frames * 3               array of box dimensions
+            -ref_dims     - size 3 array of box dimensions
+            -out          - (optional) n_frames * n_particles * 3 array to write the scaled coordinates into
+            -scale_factor - (optional) precomputed calc_scale_factor(traj_dims, ref_dims)
 
         Returns
-            -scaled_xyz  - scaled coordinates same size as traj_xyz
+            -scaled_xyz   - n_frames * n_particles * 3 scaled coordinates
     '''
+    if __debug__:
+        _check_scaling_inputs(traj_xyz, traj_dims, ref_dims, single_frame_ok=True)
+        if scale_factor is not None:
+            _check_scale_factor(traj_dims, scale_factor)
 
-    # make sure back dims match up
-    if traj_xyz.shape[2] != 3 or traj_dims.shape[1] != 3 or ref_dims.shape != (3,):
-        raise ValueError("One of the inputs does not have 3 as it's final dimension size")
-    if traj_xyz.shape[0] != traj_dims.shape[0]:
-        raise ValueError("trajectory coords/dims have different frame counts: {} vs {}".format(traj_xyz.shape[0], traj_dims.shape[0]))  # noqa
-
-    scale_factor = traj_dims / ref_dims
-    return traj_xyz * scale_factor[:, np.newaxis, :]
+    dtype = _float_dtype(traj_xyz)
+    if scale_factor is None:
+        scale_factor = calc_scale_factor(traj_dims, ref_dims, dtype)
+    scale_factor = scale_factor.astype(dtype, copy=False)
+    scaled_xyz = _output_array(out, traj_dims.shape[:1] + traj_xyz.shape[1:], np.result_type(traj_xyz, scale_factor))
+    return np.multiply(traj_xyz, scale_factor, out=scaled_xyz)
 
 
-def calc_posres_forces(displacements, spring_constant):
+def calc_posres_forces(traj_xyz, ref_xyz, spring_constant, out=None, backend='numpy'):
     '''
         Calculates the average force acting on a dummy particle kept in place using position restraints. This is done
         by calculating the displacement of the bead from its equilibrium value and using the spring constant force
@@ -95,24 +344,146 @@ def calc_posres_forces(displacements, spring_constant):
             F = -kX   (kX to keep a particle at a specific distance from reference)
 
         Parameters
-            -displacements   - n_frames * n_particles * xyz
+            -traj_xyz        - n_frames * n_particles * xyz
+            -ref_xyz         - 1 * n_particles * xyz or n_frames * n_particles * xyz reference coordinates. A single
+                               reference frame is broadcast against every trajectory frame without being copied
             -spring constant - force constant that keeps dummy particles in place. Gromacs units are k=kJ/(mol nm^2)
+            -out             - (optional) n_frames * n_particles * xyz array to write the forces into
+            -backend         - 'numpy', or 'cupy' to calculate on the GPU. The cupy backend returns a cupy array
 
         Returns
             - forces         - n_frames * n_particles * xyz - dimensional components of forces
     '''
-    return  spring_constant * displacements
+    _check_reference(traj_xyz, ref_xyz)
+
+    dtype = _float_dtype(traj_xyz, ref_xyz)
+    if _use_cupy(backend, out):
+        return dtype.type(spring_constant) * (cp.asarray(traj_xyz, dtype=dtype) - cp.asarray(ref_xyz, dtype=dtype))
+
+    forces = _output_array(out, traj_xyz.shape, dtype)
+    spring_constant = forces.dtype.type(spring_constant)
+
+    n_frames = traj_xyz.shape[0]
+    tile = _frame_tile(traj_xyz, forces.dtype)
+
+    # the same operation is applied to every particle and dimension, so when the layouts allow it work on flat
+    # n_frames * (n_particles * xyz) views. Each ufunc call then runs one long contiguous inner loop per frame
+    # instead of going through the buffered broadcasting iterator
+    work_traj, work_ref, work_forces = traj_xyz, ref_xyz, forces
+    if traj_xyz.flags.c_contiguous and ref_xyz.flags.c_contiguous and forces.flags.c_contiguous:
+        frame_size = traj_xyz.shape[1] * traj_xyz.shape[2]
+        work_traj = traj_xyz.reshape(n_frames, frame_size)
+        work_ref = ref_xyz.reshape(ref_xyz.shape[0], frame_size)
+        work_forces = forces.reshape(n_frames, frame_size)
+
+    for f0 in range(0, n_frames, tile):
+        f1 = min(f0 + tile, n_frames)
+        tile_forces = work_forces[f0:f1]
+        tile_ref = work_ref if work_ref.shape[0] == 1 else work_ref[f0:f1]
+        np.subtract(work_traj[f0:f1], tile_ref, out=tile_forces)
+        np.multiply(tile_forces, spring_constant, out=tile_forces)
+    return forces
+
+
+def calc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, spring_constant, out=None, backend='numpy',
+                              scale_factor=None):
+    '''
+        Scales reference coordinates to the trajectory box dimensions and calculates the position restraint forces,
+        equivalent to calc_posres_forces(traj_xyz, scale_box_coordinates(ref_xyz, traj_dims, ref_dims), k). With
+        numba available this is done in a single pass, without allocating the scaled reference or displacements.
+
+        Parameters
+            -traj_xyz        - n_frames * n_particles * 3 array of coordinates
+            -ref_xyz         - 1 * n_particles * 3 or n_frames * n_particles * 3 reference coordinates
+            -traj_dims       - n_frames * 3 array of box dimensions
+            -ref_dims        - size 3 array of reference box dimensions
+            -spring constant - force constant that keeps dummy particles in place. Gromacs units are k=kJ/(mol nm^2)
+            -out             - (optional) n_frames * n_particles * 3 array to write the forces into, may be traj_xyz
+            -backend         - 'numpy', or 'cupy' to calculate on the GPU. The cupy backend returns a cupy array
+            -scale_factor    - (optional) precomputed calc_scale_factor(traj_dims, ref_dims)
+
+        Returns
+            - forces         - n_frames * n_particles * 3 - dimensional components of forces
+    '''
+    if __debug__ or HAS_NUMBA:
+        _check_scaling_inputs(traj_xyz, traj_dims, ref_dims)
+        _check_reference(traj_xyz, ref_xyz)
+        if scale_factor is not None:
+            _check_scale_factor(traj_dims, scale_factor)
+
+    dtype = _float_dtype(traj_xyz, ref_xyz)
+    if scale_factor is None:
+        scale_factor = calc_scale_factor(traj_dims, ref_dims, dtype)
+    if _use_cupy(backend, out):
+        return _cupy_scaled_posres_forces(cp.asarray(traj_xyz, dtype=dtype), cp.asarray(ref_xyz, dtype=dtype),
+                                          cp.asarray(scale_factor, dtype=dtype), dtype.type(spring_constant))
+
+    forces = _output_array(out, traj_xyz.shape, dtype)
+    if not HAS_NUMBA:
+        # the scaled reference is written straight into the output array and turned into forces in place, unless
+        # out overlaps traj_xyz, which is still needed after scaling
+        scaled_ref = None if np.shares_memory(forces, traj_xyz) else forces
+        scaled_ref = scale_box_coordinates(ref_xyz, traj_dims, ref_dims, out=scaled_ref, scale_factor=scale_factor)
+        np.subtract(traj_xyz, scaled_ref, out=forces)
+        np.multiply(forces, forces.dtype.type(spring_constant), out=forces)
+        return forces
+
+    _scaled_posres_forces(traj_xyz, ref_xyz, scale_factor.astype(forces.dtype, copy=False),
+                          forces.dtype.type(spring_constant), forces)
+    return forces
+
+
+def calc_pbc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, spring_constant, out=None,
+                                  backend='numpy', scale_factor=None, inv_boxdims=None):
+    '''
+        Same as calc_scaled_posres_forces, but displacements from the scaled reference are taken to the closest
+        periodic image of the trajectory box (see calc_vectors), so particles that crossed the box boundary don't
+        show huge forces. With numba available scaling, displacement, periodic correction and the spring force are
+        done in a single pass.
+
+        Parameters
+            -traj_xyz        - n_frames * n_particles * 3 array of coordinates
+            -ref_xyz         - 1 * n_particles * 3 or n_frames * n_particles * 3 reference coordinates
+            -traj_dims       - n_frames * 3 array of box dimensions
+            -ref_dims        - size 3 array of reference box dimensions
+            -spring constant - force constant that keeps dummy particles in place. Gromacs units are k=kJ/(mol nm^2)
+            -out             - (optional) n_frames * n_particles * 3 array to write the forces into, may be traj_xyz
+            -backend         - 'numpy', or 'cupy' to calculate on the GPU. The cupy backend returns a cupy array
+            -scale_factor    - (optional) precomputed calc_scale_factor(traj_dims, ref_dims)
+            -inv_boxdims     - (optional) precomputed 1 / traj_dims, see calc_vectors
 
+        Returns
+            - forces         - n_frames * n_particles * 3 - dimensional components of forces
+    '''
+    if __debug__ or HAS_NUMBA:
+        _check_scaling_inputs(traj_xyz, traj_dims, ref_dims)
+        _check_reference(traj_xyz, ref_xyz)
+        if scale_factor is not None:
+            _check_scale_factor(traj_dims, scale_factor)
+        if inv_boxdims is not None:
+            _check_inverse_boxdims(traj_dims, inv_boxdims)
 
-if __name__ == '__main__':
-    # testing
-    prefix = '/home/kevin/hdd/Projects/software_validation/dummy_particles/flat_bilayer/dummy_3.6nm/'
-    top_force = file_io.load_xvg(prefix + 'freeze/data/dummy_top_force.xvg', dims=3)
+    dtype = _float_dtype(traj_xyz, ref_xyz)
+    if scale_factor is None:
+        scale_factor = calc_scale_factor(traj_dims, ref_dims, dtype)
+    if _use_cupy(backend, out):
+        scaled_ref = cp.asarray(ref_xyz, dtype=dtype) * cp.asarray(scale_factor, dtype=dtype)
+        vecs = _cupy_pbc_vectors(scaled_ref, cp.asarray(traj_xyz, dtype=dtype),
+                                 cp.asarray(traj_dims, dtype=dtype)[:, np.newaxis, :])
+        return dtype.type(spring_constant) * vecs
 
-    dummy_ref  = md.load(prefix + 'pos_res/dummy_ref.pdb')
-    dummy_traj = md.load_xtc(prefix + 'pos_res/dummy_coords.xtc', top=prefix + 'pos_res/dummy_firstframe.pdb')
-    dummy_ref_dims = dummy_ref.unitcell_lengths
-    dummy_traj_dims = dummy_traj.unitcell_lengths
+    forces = _output_array(out, traj_xyz.shape, dtype)
+    if not HAS_NUMBA:
+        # the scaled reference is written into the output array and replaced by the displacements in calc_vectors,
+        # which only reads each element before writing it. A separate buffer is used if out overlaps traj_xyz
+        scaled_ref = None if np.shares_memory(forces, traj_xyz) else forces
+        scaled_ref = scale_box_coordinates(ref_xyz, traj_dims, ref_dims, out=scaled_ref, scale_factor=scale_factor)
+        calc_vectors(scaled_ref, traj_xyz, traj_dims, out=forces, inv_boxdims=inv_boxdims)
+        np.multiply(forces, forces.dtype.type(spring_constant), out=forces)
+        return forces
 
-    a = calc_posres_forces(dummy_traj.xyz, dummy_ref.xyz, 1000,
-                           scaling=True, traj_dims=dummy_traj_dims, ref_dims=dummy_ref_dims)
+    box = traj_dims.astype(forces.dtype, copy=False)
+    inv_box = np.reciprocal(box) if inv_boxdims is None else inv_boxdims.astype(forces.dtype, copy=False)
+    _pbc_scaled_posres_forces(traj_xyz, ref_xyz, scale_factor.astype(forces.dtype, copy=False), box, inv_box,
+                              forces.dtype.type(spring_constant), forces)
+    return forces
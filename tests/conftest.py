@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the unit tests are run with pytest, from the repository root or tests/. Makes the modules in the repository root
+# importable from the tests
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -1,7 +1,8 @@
+import os
 import unittest
-import sys
-sys.path.append('..')
-import file_io    # noqa
+import file_io
+
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'test_file_io')
 
 
 # ----------------------------------------------
@@ -9,44 +10,54 @@ import file_io    # noqa
 # ----------------------------------------------
 class test_load_xvg(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # parse each fixture once, tests only read the loaded arrays
+        cls._cache = {
+            ('data_1D.xvg', 1):         file_io.load_xvg(os.path.join(FILES, 'data_1D.xvg'), dims=1),
+            ('data_2D.xvg', 2):         file_io.load_xvg(os.path.join(FILES, 'data_2D.xvg'), dims=2),
+            ('data_3D.xvg', 3):         file_io.load_xvg(os.path.join(FILES, 'data_3D.xvg'), dims=3),
+            ('data_3D.xvg', 3, 'time'): file_io.load_xvg(os.path.join(FILES, 'data_3D.xvg'), dims=3,
+                                                         return_time_data=True),
+            ('fake_3D_data.xvg', 3):    file_io.load_xvg(os.path.join(FILES, 'fake_3D_data.xvg'), dims=3),
+            ('data_&comments.xvg', 3):  file_io.load_xvg(os.path.join(FILES, 'data_&comments.xvg'), dims=3,
+                                                         comments=('#', '@', '&')),
+        }
+
     def test_xvg_1D(self):
-        data = file_io.load_xvg('files/test_file_io/data_1D.xvg', dims=1)
+        data = self._cache['data_1D.xvg', 1]
         self.assertEqual(data.shape[0], 6)
         self.assertEqual(data.shape[1], 10)
         self.assertEqual(data.shape[2], 1)
 
     def test_xvg_2D(self):
-        data = file_io.load_xvg('files/test_file_io/data_2D.xvg', dims=2)
+        data = self._cache['data_2D.xvg', 2]
         self.assertEqual(data.shape[0], 6)
         self.assertEqual(data.shape[1], 10)
         self.assertEqual(data.shape[2], 2)
 
     def test_xvg_3D(self):
-        data = file_io.load_xvg('files/test_file_io/data_3D.xvg', dims=3)
+        data = self._cache['data_3D.xvg', 3]
         self.assertEqual(data.shape[0], 6)
         self.assertEqual(data.shape[1], 10)
         self.assertEqual(data.shape[2], 3)
 
     def test_fakedata_3D(self):
         #  make sure reordering is correct, values actually right
-        data = file_io.load_xvg('files/test_file_io/fake_3D_data.xvg', dims=3)
+        data = self._cache['fake_3D_data.xvg', 3]
         self.assertEqual(data[1, 1, 0], 10)
         self.assertEqual(data[1, 1, 1], 11)
         self.assertEqual(data[1, 1, 2], 12)
 
     def test_xvg_return_time(self):
-        data, time = file_io.load_xvg('files/test_file_io/data_3D.xvg', dims=3, return_time_data=True)
+        data, time = self._cache['data_3D.xvg', 3, 'time']
         self.assertEqual(time.size, 6)
 
     def test_xvg_comments(self):
-        data = file_io.load_xvg('files/test_file_io/data_&comments.xvg', dims=3, comments=('#', '@', '&'))
+        data = self._cache['data_&comments.xvg', 3]
         self.assertEqual(data.shape[0], 6)
         self.assertEqual(data.shape[1], 10)
         self.assertEqual(data.shape[2], 3)
 
     def test_xvg_column_mismatch_error(self):
-        self.assertRaises(ValueError, file_io.load_xvg, 'files/test_file_io/data_1D.xvg', dims=3)
-
-
-if __name__ == '__main__':
-    unittest.main()
+        self.assertRaises(ValueError, file_io.load_xvg, os.path.join(FILES, 'data_1D.xvg'), dims=3)
@@ -1,8 +1,10 @@
 import unittest
+from unittest import mock
 import numpy as np
-import sys
-sys.path.append('..')
-import force_analysis  # noqa
+import force_analysis
+
+# mdtraj coordinates are single precision, so fixtures are too
+DTYPE = np.float32
 
 
 # -------------------------------
@@ -10,90 +12,306 @@ import force_analysis  # noqa
 # -------------------------------
 class test_scale_box_coordinates(unittest.TestCase):
 
+    @unittest.skipUnless(__debug__, "shape checks are skipped under python -O")
     def test_dims_mismatch_error(self):
-        traj_xyz = np.ones((10, 8, 3))
-        traj_dims = 100 + (np.random.rand(10, 3))
-        ref_dims = 100 + np.random.rand(2)
+        # values are irrelevant, the error comes from the size 2 ref_dims
+        traj_xyz = np.ones((10, 8, 3), dtype=DTYPE)
+        traj_dims = np.empty((10, 3), dtype=DTYPE)
+        ref_dims = np.empty(2, dtype=DTYPE)
         self.assertRaises(ValueError, force_analysis.scale_box_coordinates, traj_xyz, traj_dims, ref_dims)
 
+    @unittest.skipUnless(__debug__, "shape checks are skipped under python -O")
     def test_all_3D_error(self):
-        good_xyz,  bad_xyz  = np.ones((10, 5, 3)), np.ones((10, 5, 2))
-        good_dims, bad_dims = np.ones((10, 3)),    np.ones((10, 1))
-        good_ref,  bad_ref  = np.ones((3)),        np.ones((2))
+        good_xyz,  bad_xyz  = np.ones((10, 5, 3), dtype=DTYPE), np.ones((10, 5, 2), dtype=DTYPE)
+        good_dims, bad_dims = np.ones((10, 3), dtype=DTYPE),    np.ones((10, 1), dtype=DTYPE)
+        good_ref,  bad_ref  = np.ones((3), dtype=DTYPE),        np.ones((2), dtype=DTYPE)
         self.assertRaises(ValueError, force_analysis.scale_box_coordinates, good_xyz, good_dims,  bad_ref)
         self.assertRaises(ValueError, force_analysis.scale_box_coordinates, good_xyz,  bad_dims, good_ref)
         self.assertRaises(ValueError, force_analysis.scale_box_coordinates, bad_xyz,  good_dims, good_ref)
 
     def test_scaling(self):
-        traj_xyz  = np.zeros((10, 5, 3)) + (15, 10, 5)
-        traj_dims = np.zeros((10, 3)) + 3
-        ref_dims  = np.array((1, 6, 3))
+        traj_xyz  = np.broadcast_to(np.array([15., 10., 5.], dtype=DTYPE), (10, 5, 3))
+        traj_dims = np.full((10, 3), 3, dtype=DTYPE)
+        ref_dims  = np.array((1, 6, 3), dtype=DTYPE)
         # dims are 3X, 0.5X and 1X reference. So should be 15 * 3, 10 * 0.5, 5 * 1
         scaled_coords = force_analysis.scale_box_coordinates(traj_xyz, traj_dims, ref_dims)
         self.assertTrue(all(scaled_coords[5, 0, :] == (45, 5, 5)))
 
+    def test_scaling_leaves_input_unchanged(self):
+        traj_xyz  = np.tile(np.array([15., 10., 5.], dtype=DTYPE), (10, 5, 1))   # writable, unlike a broadcast view
+        traj_dims = np.full((10, 3), 3, dtype=DTYPE)
+        ref_dims  = np.array((1, 6, 3), dtype=DTYPE)
+        force_analysis.scale_box_coordinates(traj_xyz, traj_dims, ref_dims)
+        self.assertTrue(all(traj_xyz[5, 0, :] == (15, 10, 5)))
+
+    def test_precomputed_scale_factor(self):
+        traj_xyz  = np.broadcast_to(np.array([15., 10., 5.], dtype=DTYPE), (10, 5, 3))
+        traj_dims = np.full((10, 3), 3, dtype=DTYPE)
+        ref_dims  = np.array((1, 6, 3), dtype=DTYPE)
+        scale_factor = force_analysis.calc_scale_factor(traj_dims, ref_dims)
+        self.assertSequenceEqual(scale_factor.shape, (10, 1, 3))
+        scaled_coords = force_analysis.scale_box_coordinates(traj_xyz, traj_dims, ref_dims, scale_factor=scale_factor)
+        self.assertTrue(all(scaled_coords[5, 0, :] == (45, 5, 5)))
+        self.assertRaises(ValueError, force_analysis.scale_box_coordinates, traj_xyz, traj_dims, ref_dims,
+                          scale_factor=scale_factor[:5])
+
     def test_coordinate_frame_multiplication(self):
-        ref_xyz = np.ones((1, 10, 3))
+        ref_xyz = np.ones((1, 10, 3), dtype=DTYPE)
         mult_xyz = force_analysis.multiply_coordinate_frame(ref_xyz, 15)
         self.assertSequenceEqual(mult_xyz.shape, (15, 10, 3))
 
+    def test_coordinate_frame_multiplication_error(self):
+        self.assertRaises(ValueError, force_analysis.multiply_coordinate_frame, np.ones((2, 10, 3), dtype=DTYPE), 15)
+
+
+class test_soa_conversion(unittest.TestCase):
+
+    def test_round_trip(self):
+        xyz = np.arange(60).reshape((4, 5, 3))
+        x, y, z = force_analysis.aos_to_soa(xyz)
+        self.assertSequenceEqual(x.shape, (4, 5))
+        self.assertTrue(x.flags['C_CONTIGUOUS'])
+        self.assertEqual(y[2, 3], xyz[2, 3, 1])
+        self.assertTrue((force_analysis.soa_to_aos(x, y, z) == xyz).all())
+
 
 class test_calc_vectors(unittest.TestCase):
-    def test_coordinate_mismatch_exceptions(self):
-        cp = np.ones((10, 20, 3))
-        cd1 = np.ones((9, 20, 3))    # bad frame number
-        cd2 = np.ones((10, 10, 3))   # bad particle number
-        cd3 = np.ones((10, 20, 2))   # bad dimension number
-        boxdims = np.ones((10, 3))   # correct
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp, cd1, boxdims)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp, cd2, boxdims)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp, cd3, boxdims)
-
-    def test_coordinate_boxdim_mismatch_exceptions(self):
-        cp = np.ones((10, 20, 3))
-        boxdims = np.ones((9, 3))    # not enough frames
-        boxdims2 = np.ones((10, 2))  # not enough dimensions
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp, cp, boxdims)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp, cp, boxdims2)
-
-    def test_bad_input_dimension_exceptions(self):
-        cp_too_few       = np.ones((100, 3))
-        cp_too_many      = np.ones((100, 20, 3, 4))
-        cp_good          = np.ones((100, 20, 3))
-        boxdims_too_few  = np.ones(100)
-        boxdims_too_many = np.ones((100, 3, 10))
-        boxdims_good     = np.ones((100, 3))
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp_too_few, cp_too_few, boxdims_good)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp_too_many, cp_too_many, boxdims_good)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp_good, cp_good, boxdims_too_few)
-        self.assertRaises(ValueError, force_analysis.calc_vectors, cp_good, cp_good, boxdims_too_many)
+    def test_input_shape_exceptions(self):
+        # every case is a read only view of one shared array, only the shapes matter
+        base = np.broadcast_to(DTYPE(1), (100, 20, 3, 10))
+        cp, cp_100 = base[:10, :, :, 0], base[:, :, :, 0]             # 10 and 100 frames of 20 particles in 3D
+        boxdims, boxdims_100 = base[:10, 0, :, 0], base[:, 0, :, 0]   # matching box dimensions
+        cases = [
+            ((cp, base[:9, :, :, 0], boxdims),                 "bad frame number"),
+            ((base[:5, :, :, 0], cp, boxdims),                 "destination with more frames"),
+            ((cp, base[:10, :10, :, 0], boxdims),              "bad particle number"),
+            ((cp, base[:10, :, :2, 0], boxdims),               "bad dimension number"),
+            ((cp, cp, base[:9, 0, :, 0]),                      "boxdims with not enough frames"),
+            ((cp, cp, base[:10, 0, :2, 0]),                    "boxdims with not enough dimensions"),
+            ((base[:, 0, :, 0], base[:, 0, :, 0], boxdims_100), "coordinates with too few dimensions"),
+            ((base[:, :, :, :4], base[:, :, :, :4], boxdims_100), "coordinates with too many dimensions"),
+            ((cp_100, cp_100, base[:, 0, 0, 0]),               "boxdims with too few dimensions"),
+            ((cp_100, cp_100, base[:, 0, :, :]),               "boxdims with too many dimensions"),
+        ]
+        for args, msg in cases:
+            with self.subTest(msg=msg):
+                self.assertRaises(ValueError, force_analysis.calc_vectors, *args)
 
     def test_for_correct_vectors(self):
-        boxdims = np.array([[10, 10, 10], [9.5, 9.5, 9.5]])   # 2 frames, 3D
-        p_low  = np.ones((2, 2, 3))          # = 1
-        p_high = np.ones((2, 2, 3)) + 8.4    # = 9.4
-        p_mid  = np.ones((2, 2, 3)) + 4      # = 5
-        vecs_pos_no_pi   = force_analysis.calc_vectors(p_mid, p_high, boxdims)
-        vecs_neg_no_pi   = force_analysis.calc_vectors(p_mid,  p_low, boxdims)
-        vecs_prev_pi     = force_analysis.calc_vectors(p_low, p_high, boxdims)
-        vecs_next_pi     = force_analysis.calc_vectors(p_high, p_low, boxdims)
-        self.assertAlmostEqual(vecs_pos_no_pi[0, 0, 2], 4.4)
-        self.assertAlmostEqual(vecs_neg_no_pi[1, 1, 2], -4)
-        self.assertAlmostEqual(vecs_prev_pi[0, 0, 0], -1.6)
-        self.assertAlmostEqual(vecs_next_pi[1, 1, 1], 1.1)   # 2nd frame, 9.5 size
+        boxdims = np.array([[10, 10, 10], [9.5, 9.5, 9.5]], dtype=DTYPE)   # 2 frames, 3D
+        p_low  = np.ones((2, 2, 3), dtype=DTYPE)
+        p_high = np.full((2, 2, 3), 9.4, dtype=DTYPE)
+        p_mid  = np.full((2, 2, 3), 5, dtype=DTYPE)
+        # four scenarios side by side along the particle axis, 2 particles each:
+        # positive and negative vectors with no periodic image, then previous and next periodic image
+        p1 = np.concatenate([p_mid, p_mid, p_low, p_high], axis=1)
+        p2 = np.concatenate([p_high, p_low, p_high, p_low], axis=1)
+        vecs = force_analysis.calc_vectors(p1, p2, boxdims)
+        expected = np.array([[4.4, -4, -1.6, 1.6],     # 1st frame, 10 size
+                             [4.4, -4, -1.1, 1.1]], dtype=DTYPE)    # 2nd frame, 9.5 size
+        expected = np.broadcast_to(np.repeat(expected, 2, axis=1)[:, :, np.newaxis], (2, 8, 3))
+        np.testing.assert_allclose(vecs, expected, atol=1e-6)   # single precision
+
+    @unittest.skipUnless(force_analysis.HAS_NUMBA, "thread count only applies to the numba kernels")
+    def test_single_thread(self):
+        boxdims = np.full((20, 3), 10, dtype=DTYPE)
+        n_threads = force_analysis.numba.get_num_threads()
+        force_analysis.set_num_threads(1)
+        try:
+            self.assertEqual(force_analysis.numba.get_num_threads(), 1)
+            p_dest = np.full((20, 4, 3), 9, dtype=DTYPE)
+            vecs = force_analysis.calc_vectors(np.ones((20, 4, 3), dtype=DTYPE), p_dest, boxdims)
+        finally:
+            force_analysis.set_num_threads(n_threads)
+        self.assertEqual(force_analysis.numba.get_num_threads(), n_threads)
+        self.assertTrue((vecs == -2).all())
+
+    def test_precomputed_inverse_boxdims(self):
+        boxdims = np.full((2, 3), 10, dtype=DTYPE)
+        p_origin, p_dest = np.ones((2, 4, 3), dtype=DTYPE), np.full((2, 4, 3), 9, dtype=DTYPE)
+        vecs = force_analysis.calc_vectors(p_origin, p_dest, boxdims, inv_boxdims=1 / boxdims)
+        self.assertTrue((vecs == -2).all())
+
+    @unittest.skipUnless(__debug__, "shape checks are skipped under python -O")
+    def test_inverse_boxdims_mismatch_error(self):
+        boxdims = np.full((2, 3), 10, dtype=DTYPE)
+        p_origin = np.ones((2, 4, 3), dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_vectors, p_origin, p_origin, boxdims,
+                          inv_boxdims=1 / boxdims[:1])
+
+    def test_single_precision_preserved(self):
+        coords  = np.ones((2, 4, 3), dtype=np.float32)
+        boxdims = np.full((2, 3), 10, dtype=np.float64)   # float64, like a user supplied box
+        vecs = force_analysis.calc_vectors(coords, coords, boxdims)
+        self.assertEqual(vecs.dtype, np.float32)
+
+    def test_output_array(self):
+        boxdims = np.full((2, 3), 10, dtype=DTYPE)
+        out = np.zeros((2, 4, 3), dtype=DTYPE)
+        p_dest = np.full((2, 4, 3), 9, dtype=DTYPE)
+        vecs = force_analysis.calc_vectors(np.ones((2, 4, 3), dtype=DTYPE), p_dest, boxdims, out=out)
+        self.assertIs(vecs, out)
+        self.assertAlmostEqual(out[1, 3, 2], -2)
+        p_origin = np.ones((2, 4, 3), dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_vectors, p_origin, p_origin, boxdims,
+                          out=np.zeros((2, 3, 3), dtype=DTYPE))
 
 
 class test_calc_posres_forces(unittest.TestCase):
 
     def test_spring_constant_calculation(self):
-        positive_displacements = np.zeros((10, 20, 3)) + 3.33
-        negative_displacements = np.zeros((4,  18, 3)) - 3
-        forces     = force_analysis.calc_posres_forces(positive_displacements, 10)
-        forces_neg = force_analysis.calc_posres_forces(negative_displacements, 10)
+        positive_displacements = np.full((10, 20, 3), 3.33, dtype=DTYPE)
+        negative_displacements = np.full((4,  18, 3), -3, dtype=DTYPE)
+        forces     = force_analysis.calc_posres_forces(positive_displacements, np.zeros((10, 20, 3), dtype=DTYPE), 10)
+        forces_neg = force_analysis.calc_posres_forces(negative_displacements, np.zeros((4,  18, 3), dtype=DTYPE), 10)
         self.assertSequenceEqual(negative_displacements.shape, (4, 18, 3))
         self.assertAlmostEqual(forces[0, 0, 0], 33.3)
         self.assertEqual(forces_neg[3, 10, 2], -30)
 
+    def test_single_reference_frame(self):
+        traj_xyz = np.full((10, 20, 3), 5, dtype=DTYPE)
+        ref_xyz  = np.broadcast_to(DTYPE(1), (1, 20, 3))
+        forces = force_analysis.calc_posres_forces(traj_xyz, ref_xyz, 10)
+        self.assertSequenceEqual(forces.shape, (10, 20, 3))
+        self.assertEqual(forces[9, 19, 2], 40)
+
+    def test_output_array(self):
+        out = np.zeros((10, 20, 3), dtype=DTYPE)
+        traj_xyz = np.full((10, 20, 3), 5, dtype=DTYPE)
+        forces = force_analysis.calc_posres_forces(traj_xyz, np.broadcast_to(DTYPE(1), (1, 20, 3)), 10, out=out)
+        self.assertIs(forces, out)
+        self.assertEqual(out[9, 19, 2], 40)
+        self.assertRaises(ValueError, force_analysis.calc_posres_forces, traj_xyz, traj_xyz[:1], 10,
+                          out=np.zeros((1, 20, 3), dtype=DTYPE))
+
+    def test_unknown_backend_error(self):
+        traj_xyz = np.ones((10, 20, 3), dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_posres_forces, traj_xyz, traj_xyz, 10, backend='opencl')
+
+    def test_single_precision_preserved(self):
+        traj_xyz = np.ones((10, 20, 3), dtype=np.float32)
+        forces = force_analysis.calc_posres_forces(traj_xyz, traj_xyz[:1], 1000.0)
+        self.assertEqual(forces.dtype, np.float32)
+        forces = force_analysis.calc_scaled_posres_forces(traj_xyz, traj_xyz[:1], np.ones((10, 3)), np.ones(3), 1000.0)
+        self.assertEqual(forces.dtype, np.float32)
+
+    def test_reference_shape_mismatch_error(self):
+        traj_xyz = np.ones((10, 20, 3), dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_posres_forces, traj_xyz, np.ones((2, 20, 3), dtype=DTYPE), 10)
+        self.assertRaises(ValueError, force_analysis.calc_posres_forces, traj_xyz, np.ones((1, 19, 3), dtype=DTYPE), 10)
+        # more reference frames than trajectory frames, the tiled loop would otherwise use the first 10
+        self.assertRaises(ValueError, force_analysis.calc_posres_forces, traj_xyz, np.ones((20, 20, 3), dtype=DTYPE),
+                          10)
+
+
+class test_calc_scaled_posres_forces(unittest.TestCase):
+
+    def test_matches_unfused_calculation(self):
+        traj_xyz  = np.broadcast_to(np.array([15., 10., 5.], dtype=DTYPE), (10, 5, 3))
+        ref_xyz   = np.broadcast_to(np.array([4., 12., 2.], dtype=DTYPE), (1, 5, 3))
+        traj_dims = np.full((10, 3), 3, dtype=DTYPE)
+        ref_dims  = np.array((1, 6, 3), dtype=DTYPE)
+        # scaled reference is (12, 6, 2), so displacements are (3, 4, 3)
+        forces = force_analysis.calc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10)
+        self.assertSequenceEqual(forces.shape, (10, 5, 3))
+        self.assertTrue(all(forces[5, 0, :] == (30, 40, 30)))
+        scale_factor = force_analysis.calc_scale_factor(traj_dims, ref_dims)
+        forces = force_analysis.calc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10,
+                                                          scale_factor=scale_factor)
+        self.assertTrue(all(forces[5, 0, :] == (30, 40, 30)))
+
+    def test_output_overlaps_trajectory(self):
+        ref_xyz   = np.broadcast_to(np.array([4., 12., 2.], dtype=DTYPE), (1, 5, 3))
+        traj_dims = np.full((10, 3), 3, dtype=DTYPE)
+        ref_dims  = np.array((1, 6, 3), dtype=DTYPE)
+        for has_numba in {False, force_analysis.HAS_NUMBA}:
+            with self.subTest(has_numba=has_numba), mock.patch.object(force_analysis, 'HAS_NUMBA', has_numba):
+                traj_xyz = np.tile(np.array([15., 10., 5.], dtype=DTYPE), (10, 5, 1))
+                forces = force_analysis.calc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10,
+                                                                  out=traj_xyz)
+                self.assertIs(forces, traj_xyz)
+                self.assertTrue(all(forces[5, 0, :] == (30, 40, 30)))
+
+    @unittest.skipUnless(__debug__, "shape checks are skipped under python -O")
+    def test_dims_mismatch_error(self):
+        traj_xyz = np.ones((10, 8, 3), dtype=DTYPE)
+        ref_xyz  = np.ones((1, 8, 3), dtype=DTYPE)
+        good_dims, bad_dims = np.ones((10, 3), dtype=DTYPE), np.ones((9, 3), dtype=DTYPE)
+        good_ref,  bad_ref  = np.ones(3, dtype=DTYPE),       np.ones(2, dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_scaled_posres_forces, traj_xyz, ref_xyz, bad_dims,
+                          good_ref, 10)
+        self.assertRaises(ValueError, force_analysis.calc_scaled_posres_forces, traj_xyz, ref_xyz, good_dims,
+                          bad_ref, 10)
+        self.assertRaises(ValueError, force_analysis.calc_scaled_posres_forces, traj_xyz, ref_xyz[:, 1:],
+                          good_dims, good_ref, 10)
+
+
+class test_calc_pbc_scaled_posres_forces(unittest.TestCase):
+
+    def test_closest_periodic_image(self):
+        traj_xyz  = np.broadcast_to(np.array([9., 5., 1.], dtype=DTYPE), (10, 5, 3))
+        ref_xyz   = np.broadcast_to(np.array([0.5, 2., 4.5], dtype=DTYPE), (1, 5, 3))
+        traj_dims = np.full((10, 3), 10, dtype=DTYPE)
+        ref_dims  = np.array((5, 5, 5), dtype=DTYPE)
+        # scaled reference is (1, 4, 9), so displacements are (8, 1, -8), closest images (-2, 1, 2)
+        forces = force_analysis.calc_pbc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10)
+        self.assertSequenceEqual(forces.shape, (10, 5, 3))
+        np.testing.assert_allclose(forces[5, 0, :], (-20, 10, 20))
+        for has_numba in {False, force_analysis.HAS_NUMBA}:
+            with self.subTest(has_numba=has_numba), mock.patch.object(force_analysis, 'HAS_NUMBA', has_numba):
+                forces = force_analysis.calc_pbc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10,
+                                                                      inv_boxdims=1 / traj_dims)
+                np.testing.assert_allclose(forces[5, 0, :], (-20, 10, 20))
+
+    def test_output_overlaps_trajectory(self):
+        ref_xyz   = np.broadcast_to(np.array([0.5, 2., 4.5], dtype=DTYPE), (1, 5, 3))
+        traj_dims = np.full((10, 3), 10, dtype=DTYPE)
+        ref_dims  = np.array((5, 5, 5), dtype=DTYPE)
+        for has_numba in {False, force_analysis.HAS_NUMBA}:
+            with self.subTest(has_numba=has_numba), mock.patch.object(force_analysis, 'HAS_NUMBA', has_numba):
+                traj_xyz = np.tile(np.array([9., 5., 1.], dtype=DTYPE), (10, 5, 1))
+                forces = force_analysis.calc_pbc_scaled_posres_forces(traj_xyz, ref_xyz, traj_dims, ref_dims, 10,
+                                                                      out=traj_xyz)
+                self.assertIs(forces, traj_xyz)
+                np.testing.assert_allclose(forces[5, 0, :], (-20, 10, 20))
+
+    @unittest.skipUnless(__debug__, "shape checks are skipped under python -O")
+    def test_dims_mismatch_error(self):
+        traj_xyz = np.ones((10, 8, 3), dtype=DTYPE)
+        self.assertRaises(ValueError, force_analysis.calc_pbc_scaled_posres_forces, traj_xyz, traj_xyz[:1],
+                          np.ones((9, 3), dtype=DTYPE), np.ones(3, dtype=DTYPE), 10)
+
+
+@unittest.skipUnless(force_analysis.HAS_NUMBA, "compares the numpy fallbacks against the numba kernels")
+class test_numpy_fallback(unittest.TestCase):
+    # small tiles, so that 25 frames of 20 particles are split over several tiles with a partial last tile
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.traj_xyz  = rng.uniform(0, 10, (25, 20, 3)).astype(DTYPE)
+        cls.ref_xyz   = rng.uniform(0, 10, (1, 20, 3)).astype(DTYPE)
+        cls.traj_dims = rng.uniform(9, 11, (25, 3)).astype(DTYPE)
+        cls.ref_dims  = np.full(3, 10, dtype=DTYPE)
+
+    def assert_matches_numba(self, func, *args):
+        expected = func(*args)
+        with mock.patch.object(force_analysis, 'HAS_NUMBA', False), \
+                mock.patch.object(force_analysis, '_TILE_BYTES', 1024):
+            self.assertLess(force_analysis._frame_tile(self.traj_xyz, DTYPE), self.traj_xyz.shape[0])
+            result = func(*args)
+        np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-4)   # float32 rounding
+
+    def test_calc_vectors(self):
+        self.assert_matches_numba(force_analysis.calc_vectors, self.traj_xyz, self.traj_xyz[::-1], self.traj_dims)
+
+    def test_calc_posres_forces(self):
+        self.assert_matches_numba(force_analysis.calc_posres_forces, self.traj_xyz, self.ref_xyz, 10)
+        self.assert_matches_numba(force_analysis.calc_posres_forces, self.traj_xyz, self.traj_xyz[::-1], 10)
+
+    def test_calc_scaled_posres_forces(self):
+        self.assert_matches_numba(force_analysis.calc_scaled_posres_forces, self.traj_xyz, self.ref_xyz,
+                                  self.traj_dims, self.ref_dims, 10)
 
-if __name__ == '__main__':
-    unittest.main()
+    def test_calc_pbc_scaled_posres_forces(self):
+        self.assert_matches_numba(force_analysis.calc_pbc_scaled_posres_forces, self.traj_xyz, self.ref_xyz,
+                                  self.traj_dims, self.ref_dims, 10)